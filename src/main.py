@@ -1,100 +1,414 @@
 """
 Quick Paste - Self-hosted pastebin for code and text sharing
 """
+import asyncio
+import hashlib
+import html
+import logging
 import os
-import json
 import secrets
+import sqlite3
 import string
-from datetime import datetime, timedelta
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
-
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import HTMLResponse, PlainTextResponse
-from pydantic import BaseModel
+from typing import Any
+
+import msgspec
+import orjson
+import zstandard
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import (
+    FileResponse, HTMLResponse, JSONResponse, PlainTextResponse, Response,
+)
 from dotenv import load_dotenv
 
 try:
     from pygments import highlight
     from pygments.lexers import get_lexer_by_name, guess_lexer, TextLexer
     from pygments.formatters import HtmlFormatter
+    from pygments.util import ClassNotFound
     HAS_PYGMENTS = True
 except ImportError:
     HAS_PYGMENTS = False
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Config
 DATA_DIR = Path(os.getenv("PASTE_DATA_DIR", "/root/source/side-projects/quick-paste/data"))
 BASE_URL = os.getenv("PASTE_BASE_URL", "http://localhost:8084")
 MAX_SIZE = int(os.getenv("PASTE_MAX_SIZE", 500_000))  # 500KB default
 DEFAULT_EXPIRY_HOURS = 24 * 7  # 1 week
+RAW_MAX_AGE = 24 * 3600  # 1 day
+HTML_CACHE_BYTES = 64 << 20  # total size of cached pages
+HTML_CACHE_MAX_PAGE = 1 << 20  # larger pages are rendered on every view
+EXPIRY_SWEEP_INTERVAL = 60  # seconds
+ZSTD_LEVEL = 3
+ZSTD_MIN_SIZE = 2048  # smaller blobs are stored uncompressed
+GZIP_MIN_SIZE = 1024  # GZipMiddleware leaves smaller bodies, and their Vary header, alone
+DB_FLUSH_DELAY = 0.1  # seconds a write may wait for its commit
+DB_RETRY_DELAY = 5  # seconds between attempts after a failed commit
+
+
+class PasteMeta(msgspec.Struct, gc=False):
+    """Metadata for one paste. Slotted and not GC-tracked to keep the index small."""
+    title: str | None
+    language: str | None
+    created_at: str
+    expires_at_ts: float | None
+    burn_after_read: bool
+    size: int
+    blob: str | None  # sha256 of the content, + ".zst" if compressed; None if stored by id
+    # Pygments alias used to render: the language if given, else guessed once
+    lexer: str | None
+    url: str
+    # HTML-escaped title/language, filled in at create time or on first render
+    title_html: str | None = None
+    language_html: str | None = None
+
+
+# In-memory index (content stored in files, metadata persisted in meta.db)
+pastes: dict[str, PasteMeta] = {}
+COLUMNS = (
+    "id", "title", "language", "created_at", "expires_at_ts", "burn_after_read", "size", "blob",
+    "lexer",
+)
+UPSERT_SQL = (
+    f"INSERT OR REPLACE INTO pastes ({', '.join(COLUMNS)}) "
+    f"VALUES ({', '.join('?' * len(COLUMNS))})"
+)
+
+# Number of pastes sharing each content blob
+_blob_refs: Counter[str] = Counter()
+
+# Rendered HTML pages, least recently viewed first
+_html_cache: OrderedDict[str, bytes] = OrderedDict()
+_html_cache_bytes = 0
 
-# In-memory index (content stored in files)
-pastes: dict[str, dict] = {}
+db: sqlite3.Connection | None = None
+_db_dirty = asyncio.Event()
+_db_stale = False  # a failed commit was rolled back; meta.db must be rewritten
 
 
 def ensure_dirs():
     DATA_DIR.mkdir(parents=True, exist_ok=True)
     (DATA_DIR / "pastes").mkdir(exist_ok=True)
+    (DATA_DIR / "blobs").mkdir(exist_ok=True)
+
+
+def open_db():
+    global db
+    db = sqlite3.connect(DATA_DIR / "meta.db", isolation_level=None, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute("""CREATE TABLE IF NOT EXISTS pastes (
+        id TEXT PRIMARY KEY,
+        title TEXT,
+        language TEXT,
+        created_at TEXT NOT NULL,
+        expires_at_ts REAL,
+        burn_after_read INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        blob TEXT,
+        lexer TEXT
+    )""")
+    if "lexer" not in {row[1] for row in db.execute("PRAGMA table_info(pastes)")}:
+        db.execute("ALTER TABLE pastes ADD COLUMN lexer TEXT")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_pastes_expires_at_ts ON pastes(expires_at_ts)")
+
+
+def import_legacy_index():
+    """Move metadata from the old index.json into the database, once."""
+    index_file = DATA_DIR / "index.json"
+    if not index_file.exists():
+        return
+    legacy = orjson.loads(index_file.read_bytes())
+    for v in legacy.values():
+        if v.get("expires_at"):
+            expires_at = datetime.fromisoformat(v["expires_at"]).replace(tzinfo=timezone.utc)
+            v["expires_at_ts"] = expires_at.timestamp()
+    with db:
+        db.executemany(
+            UPSERT_SQL, [(k, *(v.get(c) for c in COLUMNS[1:])) for k, v in legacy.items()]
+        )
+    index_file.rename(index_file.with_suffix(".json.imported"))
 
 
 def load_index():
+    """Open the metadata database and load it into memory."""
     global pastes
-    index_file = DATA_DIR / "index.json"
-    if index_file.exists():
-        pastes = json.loads(index_file.read_text())
-        # Clean expired
-        now = datetime.utcnow()
-        expired = [k for k, v in pastes.items() 
-                   if v.get("expires_at") and datetime.fromisoformat(v["expires_at"]) < now]
-        for k in expired:
-            del pastes[k]
+    open_db()
+    import_legacy_index()
+    # Clean expired
+    now = time.time()
+    expired = db.execute(
+        "SELECT id, blob FROM pastes WHERE expires_at_ts < ?", (now,)
+    ).fetchall()
+    db.execute("DELETE FROM pastes WHERE expires_at_ts < ?", (now,))
+    rows = db.execute(f"SELECT {', '.join(COLUMNS)} FROM pastes ORDER BY rowid")
+    pastes = {
+        paste_id: PasteMeta(
+            title, language, created_at, expires_at_ts, bool(burn), size, blob,
+            lexer or language, f"{BASE_URL}/{paste_id}",
+        )
+        for paste_id, title, language, created_at, expires_at_ts, burn, size, blob, lexer in rows
+    }
+    _blob_refs.clear()
+    _blob_refs.update(meta.blob for meta in pastes.values() if meta.blob)
+    for k, blob in expired:
+        if blob is None:
             (DATA_DIR / "pastes" / k).unlink(missing_ok=True)
-        if expired:
-            save_index()
+        elif not _blob_refs[blob]:
+            blob_path(blob).unlink(missing_ok=True)
 
 
-def save_index():
-    ensure_dirs()
-    index_file = DATA_DIR / "index.json"
-    index_file.write_text(json.dumps(pastes, indent=2))
+def db_write(sql: str, params: tuple):
+    """Run a write inside the open batch; db_flusher commits it shortly after.
+
+    A failed write is not raised to the caller, whose in-memory change has
+    already happened: the next commit rewrites meta.db from the index instead.
+    """
+    global _db_stale
+    try:
+        if not db.in_transaction:
+            db.execute("BEGIN")
+        db.execute(sql, params)
+    except Exception:
+        logger.exception("Writing paste metadata failed, rewriting on next commit")
+        _db_stale = True
+    _db_dirty.set()
+
+
+def db_put(paste_id: str):
+    meta = pastes[paste_id]
+    db_write(UPSERT_SQL, (paste_id, *(getattr(meta, c) for c in COLUMNS[1:])))
+
+
+def db_delete(paste_id: str):
+    db_write("DELETE FROM pastes WHERE id = ?", (paste_id,))
+
+
+def db_commit():
+    """Commit the open batch. On failure it is rolled back, and the next commit
+    rewrites meta.db from the in-memory index so no write is lost."""
+    global _db_stale
+    try:
+        if _db_stale:
+            if not db.in_transaction:
+                db.execute("BEGIN")
+            db.execute("DELETE FROM pastes")
+            db.executemany(UPSERT_SQL, [
+                (paste_id, *(getattr(meta, c) for c in COLUMNS[1:]))
+                for paste_id, meta in pastes.items()
+            ])
+        db.commit()
+        _db_stale = False
+    except Exception:
+        _db_stale = True
+        db.rollback()
+        raise
+
+
+async def db_flusher():
+    """Commit batched writes once per DB_FLUSH_DELAY instead of once per write."""
+    while True:
+        await _db_dirty.wait()
+        await asyncio.sleep(DB_FLUSH_DELAY)
+        _db_dirty.clear()
+        try:
+            db_commit()
+        except Exception:
+            logger.exception("Saving paste metadata failed, retrying")
+            _db_dirty.set()
+            await asyncio.sleep(DB_RETRY_DELAY)
+
+
+def iso_from_ts(ts: float | None) -> str | None:
+    """Format a Unix timestamp as naive UTC ISO, as the API has always returned."""
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None).isoformat()
+
+
+async def expiry_worker():
+    """Delete pastes as they expire instead of waiting for a restart."""
+    while True:
+        await asyncio.sleep(EXPIRY_SWEEP_INTERVAL)
+        try:
+            for (paste_id,) in db.execute(
+                "SELECT id FROM pastes WHERE expires_at_ts < ?", (time.time(),)
+            ).fetchall():
+                remove_paste(paste_id)
+        except Exception:
+            # A failed sweep is retried on the next tick
+            logger.exception("Expiry sweep failed")
+
+
+# Maps every byte value onto the id alphabet, so one translate() call turns
+# random bytes into an id. 256 % 36 leaves a slight bias towards "a"-"d".
+ID_ALPHABET = (string.ascii_lowercase + string.digits).encode()
+ID_TABLE = bytes(ID_ALPHABET[b % len(ID_ALPHABET)] for b in range(256))
 
 
 def generate_id(length: int = 8) -> str:
-    alphabet = string.ascii_lowercase + string.digits
     while True:
-        paste_id = ''.join(secrets.choice(alphabet) for _ in range(length))
+        paste_id = secrets.token_bytes(length).translate(ID_TABLE).decode()
         if paste_id not in pastes:
             return paste_id
 
 
-def save_content(paste_id: str, content: str):
-    ensure_dirs()
-    (DATA_DIR / "pastes" / paste_id).write_text(content)
+def blob_name(data: bytes) -> str:
+    digest = hashlib.sha256(data).hexdigest()
+    return f"{digest}.zst" if len(data) >= ZSTD_MIN_SIZE else digest
+
+
+def blob_path(name: str) -> Path:
+    return DATA_DIR / "blobs" / name[:2] / name[2:]
+
+
+# zstandard contexts are reusable but not thread-safe, so keep one per thread
+_zstd = threading.local()
+
+
+def zstd_compressor() -> zstandard.ZstdCompressor:
+    if not hasattr(_zstd, "compressor"):
+        _zstd.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+    return _zstd.compressor
+
 
+def zstd_decompressor() -> zstandard.ZstdDecompressor:
+    if not hasattr(_zstd, "decompressor"):
+        _zstd.decompressor = zstandard.ZstdDecompressor()
+    return _zstd.decompressor
 
-def load_content(paste_id: str) -> str | None:
-    paste_file = DATA_DIR / "pastes" / paste_id
-    if paste_file.exists():
-        return paste_file.read_text()
-    return None
+
+def content_path(paste_id: str, meta: PasteMeta) -> Path:
+    if meta.blob is None:  # created before content-addressed storage
+        return DATA_DIR / "pastes" / paste_id
+    return blob_path(meta.blob)
+
+
+def write_blob(name: str, data: bytes):
+    path = blob_path(name)
+    if path.exists():  # identical content already stored
+        return
+    if path.suffix == ".zst":
+        data = zstd_compressor().compress(data)
+    path.parent.mkdir(exist_ok=True)
+    tmp_file = path.with_name(f"{path.name}.{secrets.token_hex(4)}.tmp")
+    tmp_file.write_bytes(data)
+    tmp_file.replace(path)
+
+
+def read_content(paste_file: Path) -> str:
+    data = paste_file.read_bytes()
+    if paste_file.suffix == ".zst":
+        data = zstd_decompressor().decompress(data)
+    return data.decode()
+
+
+async def save_content(name: str, data: bytes):
+    await asyncio.to_thread(write_blob, name, data)
+
+
+async def load_content(paste_file: Path) -> str | None:
+    try:
+        return await asyncio.to_thread(read_content, paste_file)
+    except FileNotFoundError:
+        return None
+
+
+def release_content(paste_id: str, meta: PasteMeta):
+    """Delete a removed paste's content unless another paste still shares it.
+    
+    Runs on the event loop so a concurrent create of the same content can't
+    see the blob between the refcount check and the unlink.
+    """
+    if meta.blob is None:
+        (DATA_DIR / "pastes" / paste_id).unlink(missing_ok=True)
+        return
+    _blob_refs[meta.blob] -= 1
+    if _blob_refs[meta.blob] <= 0:
+        del _blob_refs[meta.blob]
+        blob_path(meta.blob).unlink(missing_ok=True)
+
+
+def forget_paste(paste_id: str):
+    """Drop a paste's metadata; its content is left to release_content."""
+    pastes.pop(paste_id, None)
+    uncache_page(paste_id)
+    db_delete(paste_id)
+
+
+def remove_paste(paste_id: str):
+    meta = pastes.get(paste_id)
+    if meta is None:
+        return
+    forget_paste(paste_id)
+    release_content(paste_id, meta)
+
+
+def get_live_paste(paste_id: str) -> PasteMeta:
+    """Look up a paste, removing it if it expired since the last sweep."""
+    meta = pastes.get(paste_id)
+    if meta is not None and meta.expires_at_ts is not None and meta.expires_at_ts < time.time():
+        remove_paste(paste_id)
+        meta = None
+    if meta is None:
+        raise HTTPException(status_code=404, detail="Paste not found")
+    return meta
+
+
+@lru_cache(maxsize=128)
+def _cached_lexer(name: str):
+    return get_lexer_by_name(name)
+
+
+@lru_cache(maxsize=1)
+def _cached_formatter():
+    return HtmlFormatter(linenos=True, cssclass="highlight")
+
+
+# Pygments stylesheet for the formatter above, rendered once at import
+STYLE_DEFS = _cached_formatter().get_style_defs('.highlight').encode() if HAS_PYGMENTS else b""
 
 
 def highlight_code(content: str, language: str | None = None) -> str:
     """Syntax highlight code using Pygments."""
     if not HAS_PYGMENTS:
-        return f"<pre><code>{content}</code></pre>"
+        return f"<pre><code>{html.escape(content)}</code></pre>"
     
     try:
-        if language:
-            lexer = get_lexer_by_name(language)
-        else:
-            lexer = guess_lexer(content)
+        lexer = _cached_lexer(language) if language else TextLexer()
     except:
         lexer = TextLexer()
     
-    formatter = HtmlFormatter(linenos=True, cssclass="highlight")
-    return highlight(content, lexer, formatter)
+    return highlight(content, lexer, _cached_formatter())
+
+
+def guess_language(content: str) -> str | None:
+    """Detect a lexer alias for content. Slow: runs every lexer's analyser."""
+    if not HAS_PYGMENTS:
+        return None
+    try:
+        aliases = guess_lexer(content).aliases
+    except ClassNotFound:
+        return None
+    return aliases[0] if aliases else None
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response serialized with orjson."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
 
 
 # FastAPI app
@@ -102,17 +416,29 @@ app = FastAPI(
     title="Quick Paste",
     description="Self-hosted pastebin",
     version="0.1.0",
+    default_response_class=ORJSONResponse,
 )
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_SIZE, compresslevel=5)
 
 
 @app.on_event("startup")
 async def startup():
     ensure_dirs()
-    load_index()
+    await asyncio.to_thread(load_index)
+    app.state.expiry_task = asyncio.create_task(expiry_worker())
+    app.state.flush_task = asyncio.create_task(db_flusher())
     print(f"📋 Quick Paste started with {len(pastes)} pastes")
 
 
-class PasteCreate(BaseModel):
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.expiry_task.cancel()
+    app.state.flush_task.cancel()
+    db_commit()
+    db.close()
+
+
+class PasteCreate(msgspec.Struct):
     content: str
     language: str | None = None
     title: str | None = None
@@ -120,7 +446,7 @@ class PasteCreate(BaseModel):
     burn_after_read: bool = False
 
 
-class PasteResponse(BaseModel):
+class PasteResponse(msgspec.Struct):
     id: str
     url: str
     raw_url: str
@@ -129,6 +455,19 @@ class PasteResponse(BaseModel):
     language: str | None
 
 
+# FastAPI can't see msgspec models, so the create route's OpenAPI entry is
+# filled in from msgspec's own JSON schema
+_, MODEL_SCHEMAS = msgspec.json.schema_components(
+    [PasteCreate, PasteResponse], ref_template="#/components/schemas/{name}"
+)
+VALIDATION_ERROR_SCHEMA = {
+    "title": "ValidationError",
+    "type": "object",
+    "properties": {"detail": {"type": "string"}},
+    "required": ["detail"],
+}
+
+
 @app.get("/")
 async def root():
     return {
@@ -144,8 +483,37 @@ async def root():
     }
 
 
-@app.post("/api/paste", response_model=PasteResponse)
-async def create_paste(data: PasteCreate):
+async def parse_paste_create(request: Request) -> PasteCreate:
+    """Decode and validate the request body with msgspec instead of Pydantic.
+    
+    strict=False keeps Pydantic's lax coercions, e.g. "24" for an int field.
+    """
+    try:
+        return msgspec.json.decode(await request.body(), type=PasteCreate, strict=False)
+    except msgspec.DecodeError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@app.post(
+    "/api/paste",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": MODEL_SCHEMAS["PasteCreate"]}},
+        },
+    },
+    responses={
+        200: {
+            "description": "Paste created",
+            "content": {"application/json": {"schema": MODEL_SCHEMAS["PasteResponse"]}},
+        },
+        422: {
+            "description": "Invalid request body",
+            "content": {"application/json": {"schema": VALIDATION_ERROR_SCHEMA}},
+        },
+    },
+)
+async def create_paste(data: PasteCreate = Depends(parse_paste_create)):
     """Create a new paste."""
     if len(data.content) > MAX_SIZE:
         raise HTTPException(status_code=413, detail=f"Content too large (max {MAX_SIZE} bytes)")
@@ -153,127 +521,244 @@ async def create_paste(data: PasteCreate):
     if not data.content.strip():
         raise HTTPException(status_code=400, detail="Content cannot be empty")
     
+    # Guess once here so views never have to; the guess only picks the lexer
+    lexer = data.language
+    if not lexer:
+        lexer = await asyncio.to_thread(guess_language, data.content) or "text"
+    
     paste_id = generate_id()
-    now = datetime.utcnow()
+    now = time.time()
+    content = data.content.encode()
+    blob = blob_name(content)
+    # Count the reference before awaiting so a delete can't unlink the blob
+    _blob_refs[blob] += 1
     
-    expires_at = None
+    expires_at_ts = None
     if data.expires_in_hours and data.expires_in_hours > 0:
-        expires_at = (now + timedelta(hours=data.expires_in_hours)).isoformat()
+        expires_at_ts = now + data.expires_in_hours * 3600
     
-    pastes[paste_id] = {
-        "title": data.title,
-        "language": data.language,
-        "created_at": now.isoformat(),
-        "expires_at": expires_at,
-        "burn_after_read": data.burn_after_read,
-        "size": len(data.content),
-    }
+    pastes[paste_id] = PasteMeta(
+        title=data.title,
+        language=data.language,
+        created_at=iso_from_ts(now),
+        expires_at_ts=expires_at_ts,
+        burn_after_read=data.burn_after_read,
+        size=len(data.content),
+        blob=blob,
+        lexer=lexer,
+        url=f"{BASE_URL}/{paste_id}",
+        title_html=html.escape(data.title or ""),
+        language_html=html.escape(data.language or "auto"),
+    )
     
-    save_content(paste_id, data.content)
-    save_index()
+    await save_content(blob, content)
+    db_put(paste_id)
     
-    return PasteResponse(
+    response = PasteResponse(
         id=paste_id,
-        url=f"{BASE_URL}/{paste_id}",
+        url=pastes[paste_id].url,
         raw_url=f"{BASE_URL}/{paste_id}/raw",
-        created_at=pastes[paste_id]["created_at"],
-        expires_at=expires_at,
+        created_at=pastes[paste_id].created_at,
+        expires_at=iso_from_ts(expires_at_ts),
         language=data.language,
     )
+    return Response(msgspec.json.encode(response), media_type="application/json")
 
 
 @app.get("/api/pastes")
 async def list_pastes(limit: int = 50):
     """List recent pastes (metadata only)."""
     result = []
-    for paste_id, meta in list(pastes.items())[:limit]:
+    for paste_id, meta in islice(pastes.items(), max(0, min(limit, len(pastes)))):
         result.append({
             "id": paste_id,
-            "url": f"{BASE_URL}/{paste_id}",
-            "title": meta.get("title"),
-            "language": meta.get("language"),
-            "size": meta.get("size"),
-            "created_at": meta["created_at"],
-            "expires_at": meta.get("expires_at"),
+            "url": meta.url,
+            "title": meta.title,
+            "language": meta.language,
+            "size": meta.size,
+            "created_at": meta.created_at,
+            "expires_at": iso_from_ts(meta.expires_at_ts),
         })
     return {"pastes": result, "total": len(pastes)}
 
 
+def raw_cache_control(meta: PasteMeta) -> str:
+    """Content never changes, so let caches keep it until it expires."""
+    max_age = RAW_MAX_AGE
+    if meta.expires_at_ts is not None:
+        max_age = max(0, min(max_age, int(meta.expires_at_ts - time.time())))
+    return f"public, max-age={max_age}, immutable"
+
+
+def accepts_encoding(request: Request, coding: str) -> bool:
+    """Whether Accept-Encoding allows coding, honouring q-values and "*"."""
+    qvalues = {}
+    for item in request.headers.get("accept-encoding", "").split(","):
+        name, *params = item.split(";")
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qvalues[name.strip().lower()] = q
+    return qvalues.get(coding, qvalues.get("*", 0.0)) > 0
+
+
 @app.get("/{paste_id}/raw", response_class=PlainTextResponse)
-async def get_paste_raw(paste_id: str):
+async def get_paste_raw(paste_id: str, request: Request):
     """Get raw paste content."""
-    if paste_id not in pastes:
-        raise HTTPException(status_code=404, detail="Paste not found")
+    meta = get_live_paste(paste_id)
+    
+    # Burn after read: forget it before awaiting so only one reader gets it
+    if meta.burn_after_read:
+        forget_paste(paste_id)
+        content = await load_content(content_path(paste_id, meta))
+        release_content(paste_id, meta)
+        if content is None:
+            raise HTTPException(status_code=404, detail="Paste content not found")
+        return PlainTextResponse(content, headers={"Cache-Control": "no-store"})
     
-    content = load_content(paste_id)
-    if content is None:
+    paste_file = content_path(paste_id, meta)
+    compressed = paste_file.suffix == ".zst"
+    send_zstd = compressed and accepts_encoding(request, "zstd")
+    try:
+        stat = await asyncio.to_thread(paste_file.stat)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Paste content not found")
     
-    meta = pastes[paste_id]
+    headers = {
+        "Cache-Control": raw_cache_control(meta),
+        "ETag": f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{"-zstd" if send_zstd else ""}"',
+    }
+    vary = {"Vary": "Accept-Encoding"} if compressed else {}
+    if headers["ETag"] in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers | vary)
     
-    # Burn after read
-    if meta.get("burn_after_read"):
-        del pastes[paste_id]
-        (DATA_DIR / "pastes" / paste_id).unlink(missing_ok=True)
-        save_index()
+    if compressed and not send_zstd:
+        content = await load_content(paste_file)
+        if content is None:
+            raise HTTPException(status_code=404, detail="Paste content not found")
+        response = PlainTextResponse(content, headers=headers)
+        # GZipMiddleware adds its own Vary to bodies it may compress
+        if len(response.body) < GZIP_MIN_SIZE:
+            response.headers.update(vary)
+        return response
     
-    return content
+    # Served straight from disk (sendfile where available); zstd blobs go out
+    # as-is to clients that accept that encoding, and GZipMiddleware skips them
+    if send_zstd:
+        headers["Content-Encoding"] = "zstd"
+        headers.update(vary)
+    return FileResponse(
+        paste_file, media_type="text/plain; charset=utf-8", headers=headers, stat_result=stat,
+    )
 
 
-@app.get("/{paste_id}", response_class=HTMLResponse)
-async def get_paste_html(paste_id: str):
-    """Get paste with syntax highlighting."""
-    if paste_id not in pastes:
-        raise HTTPException(status_code=404, detail="Paste not found")
-    
-    content = load_content(paste_id)
-    if content is None:
-        raise HTTPException(status_code=404, detail="Paste content not found")
-    
-    meta = pastes[paste_id]
-    title = meta.get("title") or paste_id
-    language = meta.get("language")
-    
-    highlighted = highlight_code(content, language)
-    
-    # Burn after read
-    if meta.get("burn_after_read"):
-        del pastes[paste_id]
-        (DATA_DIR / "pastes" / paste_id).unlink(missing_ok=True)
-        save_index()
-    
-    css = ""
-    if HAS_PYGMENTS:
-        css = HtmlFormatter().get_style_defs('.highlight')
-    
-    html = f"""<!DOCTYPE html>
+HTML_PREFIX = b"".join([b"""<!DOCTYPE html>
 <html>
 <head>
     <meta charset="utf-8">
-    <title>{title} - Quick Paste</title>
     <style>
-        body {{ font-family: monospace; margin: 20px; background: #1e1e1e; color: #d4d4d4; }}
-        .header {{ margin-bottom: 20px; }}
-        .header a {{ color: #569cd6; }}
-        .meta {{ color: #808080; font-size: 0.9em; }}
-        pre {{ background: #2d2d2d; padding: 15px; overflow-x: auto; }}
-        {css}
+        body { font-family: monospace; margin: 20px; background: #1e1e1e; color: #d4d4d4; }
+        .header { margin-bottom: 20px; }
+        .header a { color: #569cd6; }
+        .meta { color: #808080; font-size: 0.9em; }
+        pre { background: #2d2d2d; padding: 15px; overflow-x: auto; }
+        """, STYLE_DEFS, b"""
     </style>
+    <title>"""])
+HTML_SUFFIX = b"""
+</body>
+</html>"""
+
+
+def cache_page(paste_id: str, page: bytes):
+    global _html_cache_bytes
+    if len(page) > HTML_CACHE_MAX_PAGE:
+        return
+    uncache_page(paste_id)
+    _html_cache[paste_id] = page
+    _html_cache_bytes += len(page)
+    while _html_cache_bytes > HTML_CACHE_BYTES:
+        _, evicted = _html_cache.popitem(last=False)
+        _html_cache_bytes -= len(evicted)
+
+
+def uncache_page(paste_id: str):
+    global _html_cache_bytes
+    page = _html_cache.pop(paste_id, None)
+    if page is not None:
+        _html_cache_bytes -= len(page)
+
+
+def render_paste_html(paste_id: str, meta: PasteMeta, content: str) -> bytes:
+    if meta.title_html is None:  # loaded from meta.db, escape once on first view
+        meta.title_html = html.escape(meta.title or "")
+        meta.language_html = html.escape(meta.language or "auto")
+    title = meta.title_html or paste_id
+    language = meta.language_html
+    if meta.lexer is None:  # stored before lexers were, without a language
+        meta.lexer = guess_language(content) or "text"
+    
+    highlighted = highlight_code(content, meta.lexer)
+    
+    header = f"""{title} - Quick Paste</title>
 </head>
 <body>
     <div class="header">
         <h2>{title}</h2>
         <div class="meta">
-            Language: {language or 'auto'} | 
-            Created: {meta['created_at'][:19]} |
+            Language: {language} | 
+            Created: {meta.created_at[:19]} |
             <a href="/{paste_id}/raw">Raw</a>
         </div>
     </div>
-    {highlighted}
-</body>
-</html>"""
+    """
+    return b"".join([HTML_PREFIX, header.encode(), highlighted.encode(), HTML_SUFFIX])
+
+
+def paste_etag(paste_id: str, meta: PasteMeta) -> str:
+    return '"%s"' % hashlib.sha1((paste_id + meta.created_at).encode()).hexdigest()
+
+
+@app.get("/{paste_id}", response_class=HTMLResponse)
+async def get_paste_html(paste_id: str, request: Request):
+    """Get paste with syntax highlighting."""
+    meta = get_live_paste(paste_id)
+    
+    # Burn after read: render once, never cache
+    if meta.burn_after_read:
+        forget_paste(paste_id)
+        content = await load_content(content_path(paste_id, meta))
+        release_content(paste_id, meta)
+        if content is None:
+            raise HTTPException(status_code=404, detail="Paste content not found")
+        page = await asyncio.to_thread(render_paste_html, paste_id, meta, content)
+        return HTMLResponse(page, headers={"Cache-Control": "no-store"})
+    
+    etag = paste_etag(paste_id, meta)
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    page = _html_cache.get(paste_id)
+    if page is None:
+        content = await load_content(content_path(paste_id, meta))
+        if content is None:
+            raise HTTPException(status_code=404, detail="Paste content not found")
+        # Pygments can take most of a second on a large paste
+        guessing = meta.lexer is None
+        page = await asyncio.to_thread(render_paste_html, paste_id, meta, content)
+        if paste_id in pastes:  # not deleted while rendering
+            if guessing:
+                db_put(paste_id)
+            cache_page(paste_id, page)
+    else:
+        _html_cache.move_to_end(paste_id)
     
-    return html
+    return HTMLResponse(page, headers={"ETag": etag})
 
 
 @app.delete("/api/paste/{paste_id}")
@@ -282,9 +767,7 @@ async def delete_paste(paste_id: str):
     if paste_id not in pastes:
         raise HTTPException(status_code=404, detail="Paste not found")
     
-    del pastes[paste_id]
-    (DATA_DIR / "pastes" / paste_id).unlink(missing_ok=True)
-    save_index()
+    remove_paste(paste_id)
     
     return {"ok": True, "deleted": paste_id}
 
@@ -296,4 +779,6 @@ async def health():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8084)
+    # Single worker: the paste index and page cache live in process memory.
+    # uvicorn picks uvloop and httptools by itself where they are installed.
+    uvicorn.run(app, host="0.0.0.0", port=8084, access_log=False)